@@ -11,8 +11,14 @@ __author__ = "Tom David Müller"
 __all__ = ["pseudoknots"]
 
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from itertools import chain, product
 
+# The minimum number of regions in a conflict clique for solving
+# cliques in parallel worker processes, chosen so that the dynamic
+# programming cost clearly outweighs the process startup cost
+_MIN_PARALLEL_CLIQUE_SIZE = 32
+
 def pseudoknots(base_pairs, scores=None, max_pseudoknot_order=None):
     """
     Identify the pseudoknot order for each base pair in a given set of
@@ -124,7 +130,10 @@ def pseudoknots(base_pairs, scores=None, max_pseudoknot_order=None):
 
     # if no score array is given, each base pairs' score is one
     if scores is None:
-        scores = np.ones(len(base_pairs))
+        scores = np.ones(len(base_pairs), dtype=np.float32)
+    else:
+        # float32 halves the memory traffic of the score reductions
+        scores = np.asarray(scores, dtype=np.float32)
 
     # Make sure `base_pairs` has the same length as the score array
     if len(base_pairs) != len(scores):
@@ -136,69 +145,95 @@ def pseudoknots(base_pairs, scores=None, max_pseudoknot_order=None):
     regions = _find_regions(base_pairs, scores)
 
     # Compute results
-    results = _get_results(regions, results, max_pseudoknot_order)
+    # Different recursion branches frequently produce the same conflict
+    # cliques, whose optimal solutions are memoized in a shared cache
+    results = _get_results(
+        regions, set(range(regions.count)), results, max_pseudoknot_order,
+        solution_cache={}
+    )
 
     return np.vstack(results)
 
 
-class _Region():
+class _Regions():
     """
-    This class represents a paired region.
+    This class stores all paired regions of a base pair array in a
+    structure-of-arrays layout.
 
-    A region is a set of base pairs. This class provides methods to
-    access the minimum and maximum index of the bases that are part of
-    the region, handles score calculation, and backtracing to the
-    original base pair array.
+    A region is a set of consecutively nested base pairs. Each region
+    is identified by an integer id, which indexes the arrays of
+    minimum and maximum base positions and region scores. The
+    positions of each region's base pairs in the original base pair
+    array are kept in a flat array partitioned by an offset array,
+    enabling backtracing to the original base pair array.
 
     Parameters
     ----------
-    base_pairs: ndarray, shape=(n,2), dtype=int
-        All base pairs of the structure the region is a subset for.
-    region_pairs: ndarray, dtype=int
-        The indices of the base pairs in ``base_pairs`` that are part of
-        the region.
-    scores : ndarray, dtype=int, shape=(n,) (default: None)
+    base_pairs : ndarray, shape=(n,2), dtype=int
+        All base pairs of the structure the regions are a subset for.
+    pair_indices : ndarray, dtype=int, shape=(n,)
+        The indices of the base pairs in ``base_pairs``, grouped by
+        region.
+    offsets : ndarray, dtype=int
+        The position in ``pair_indices`` where each region's group of
+        base pairs begins.
+    scores : ndarray, dtype=int, shape=(n,)
         The score for each base pair.
-    """
-
-    def __init__ (self, base_pairs, region_pairs, scores):
-        # The Start and Stop indices for each Region
-        self.start = np.min(base_pairs[region_pairs])
-        self.stop = np.max(base_pairs[region_pairs])
-
-        self.region_pairs = region_pairs
-        self.score = np.sum(scores[region_pairs])
-
-    def get_index_array(self):
-        """
-        Return an index array with the positions of the region`s bases
-        in the original base pair array.
 
-        Returns
-        -------
-        region_pairs : ndarray
-            The indices of the bases in the original base pair array.
-        """
-        return self.region_pairs
+    Attributes
+    ----------
+    count : int
+        The number of regions.
+    starts, stops : ndarray, dtype=int32
+        The minimum and maximum base position of each region, indexed
+        by region id.
+    scores : ndarray, dtype=float32
+        The score of each region, indexed by region id.
+    """
 
-    def __lt__(self, other):
+    def __init__(self, base_pairs, pair_indices, offsets, scores):
+        self.count = len(offsets)
+        self._pair_indices = pair_indices
+        # The group boundaries in `pair_indices`, including the
+        # terminal sentinel
+        self._bounds = np.append(offsets, len(pair_indices))
+
+        # The start and stop positions and the score for each region
+        grouped_pairs = base_pairs[pair_indices]
+        self.starts = np.minimum.reduceat(
+            np.min(grouped_pairs, axis=1), offsets
+        ).astype('int32')
+        self.stops = np.maximum.reduceat(
+            np.max(grouped_pairs, axis=1), offsets
+        ).astype('int32')
+        self.scores = np.add.reduceat(
+            scores[pair_indices], offsets
+        ).astype(np.float32)
+
+    def get_index_array_for(self, region_ids):
         """
-        This comparison operator is required for :func:`np.unique()`. As
-        only the difference between the regions is relevant and not any
-        particular order, a distinction is made by the objects unique
-        ids.
+        Return an index array with the positions of multiple regions'
+        bases in the original base pair array.
 
         Parameters
         ----------
-        other : _region
-            The other region.
+        region_ids : set {int, ...}
+            The ids of the regions.
 
         Returns
         -------
-        comparision : bool
-            The evaluated comparison.
+        region_pairs : ndarray
+            The indices of the bases in the original base pair array,
+            concatenated over all given regions.
         """
-        return id(self) < id(other)
+        ids = np.fromiter(region_ids, dtype='int32', count=len(region_ids))
+        group_starts = self._bounds[ids]
+        group_stops = self._bounds[ids + 1]
+        lengths = group_stops - group_starts
+        # Enumerate each group's positions in `_pair_indices` with a
+        # single `arange` shifted per group
+        shifts = np.repeat(group_stops - np.cumsum(lengths), lengths)
+        return self._pair_indices[np.arange(lengths.sum()) + shifts]
 
 
 def _find_regions(base_pairs, scores):
@@ -216,7 +251,7 @@ def _find_regions(base_pairs, scores):
 
     Returns
     -------
-    regions : set {_region, ...}
+    regions : _Regions
         The regions representing the consecutively nested base pairs.
     """
 
@@ -230,198 +265,157 @@ def _find_regions(base_pairs, scores):
     # Rank each base
     # E.g.: [[3, 5]  --> [[0, 1]
     #        [9, 7]]      [3, 2]]
+    # Assigning the ranks directly through the sort order avoids a
+    # second sort
     order = np.argsort(sorted_base_pairs.flatten())
-    rank = np.argsort(order).reshape(base_pairs.shape)
-
-    # The base pairs belonging to the current region
-    region_pairs = []
-    # The individual regions
-    regions = set()
-
-    # Find separate regions
-    for i in range(len(sorted_base_pairs)):
-        # if a new region is to be started append the current base pair
-        if len(region_pairs) == 0:
-            region_pairs.append(original_indices[i])
-            continue
-
-        # Check if the current base pair belongs to the region that is
-        # currently being defined
-        previous_upstream_rank = rank[i-1, 0]
-        this_upstream_rank = rank[i, 0]
-        previous_downstream_rank = rank[i-1, 1]
-        this_downstream_rank = rank[i, 1]
-
-        # if the current base pair belongs to a new region, save the
-        # current region and start a new region
-        if ((previous_downstream_rank - this_downstream_rank) != 1 or
-            (this_upstream_rank - previous_upstream_rank) != 1):
-                regions.add(
-                    _Region(base_pairs, np.array(region_pairs), scores)
-                )
-                region_pairs = []
+    rank = np.empty(len(order), dtype=np.intp)
+    rank[order] = np.arange(len(order))
+    rank = rank.reshape(base_pairs.shape)
 
-        # Append the current base pair to the region
-        region_pairs.append(original_indices[i])
+    # A base pair belongs to the region of its predecessor, if its
+    # upstream rank is one higher and its downstream rank is one lower
+    # than the respective rank of the predecessor
+    upstream_rank_diff = np.diff(rank[:, 0])
+    downstream_rank_diff = np.diff(rank[:, 1])
+    # The offset in the sorted base pairs where each region starts
+    offsets = np.concatenate(([0], np.flatnonzero(
+        (upstream_rank_diff != 1) | (downstream_rank_diff != -1)
+    ) + 1))
 
-    # The last region has no endpoint defined by the beginning of a
-    # new region.
-    regions.add(_Region(base_pairs, np.array(region_pairs), scores))
+    return _Regions(base_pairs, original_indices, offsets, scores)
 
-    return regions
 
-
-def _find_non_conflicting_regions(regions):
+def _find_non_conflicting_regions(regions, region_ids):
     """
     Find regions that are not conflicting.
 
     Parameters
     ----------
-    regions : set {_region, ...}
-        Regions including conflicting regions.
+    regions : _Regions
+        All regions of the base pair array.
+    region_ids : set {int, ...}
+        The ids of the regions to be considered, including conflicting
+        regions.
 
     Returns
     -------
-    regions : set {_region, ...}
-        The non-conflicting regions.
+    region_ids : set {int, ...}
+        The ids of the non-conflicting regions.
     """
-    # Get the region array and a boolean array, where the start of each
-    # region is ``True``.
-    region_array, (start_stops,) = _get_region_array_for(
-        regions, content=[lambda a : [True, False]], dtype=['bool']
+    ids = np.fromiter(region_ids, dtype='int32', count=len(region_ids))
+    id_at_pos, start_stops = _get_region_array_for(regions, region_ids)
+
+    # The position of each region's start and stop in the region array
+    is_start = start_stops == regions.starts[id_at_pos]
+    first_pos = np.empty(regions.count, dtype=np.intp)
+    second_pos = np.empty(regions.count, dtype=np.intp)
+    first_pos[id_at_pos[is_start]] = np.flatnonzero(is_start)
+    second_pos[id_at_pos[~is_start]] = np.flatnonzero(~is_start)
+    firsts = first_pos[ids]
+    seconds = second_pos[ids]
+
+    # A region is conflicting, if and only if another region has
+    # exactly one of its end points between the region's start and
+    # stop position
+    first_inside = (
+        (firsts > firsts[:, np.newaxis]) & (firsts < seconds[:, np.newaxis])
     )
-    starts = np.nonzero(start_stops)[0]
-
-    # Regions that are not conflicting
-    non_conflicting_regions = set()
-    for start_index in starts:
-        # Get the current regions start and stop indices in the region
-        # array
-        stop_index = _get_first_occurrence_for(
-            region_array[start_index+1:], region_array[start_index]
-        )
-        stop_index = start_index + 1 + stop_index
-
-        # Count the occurrence of each individual region between the
-        # start and stop indices of the regions
-        _, counts = np.unique(
-            region_array[start_index+1:stop_index], return_counts=True
-        )
-        # if no regions are between the start and stop indices the
-        # region is non-conflicting
-        if len(counts) == 0:
-            non_conflicting_regions.add(region_array[start_index])
-        # if every region between the start and stop indices has its
-        # start and stop between the current region's start and stop
-        # indices the current region is not conflicting
-        elif np.amin(counts) == 2:
-            non_conflicting_regions.add(region_array[start_index])
+    second_inside = (
+        (seconds > firsts[:, np.newaxis]) & (seconds < seconds[:, np.newaxis])
+    )
+    non_conflicting = np.all(first_inside == second_inside, axis=1)
 
     # Return the non-conflicting regions
-    return non_conflicting_regions
+    return set(ids[non_conflicting].tolist())
 
 
-def _get_first_occurrence_for(iterable, wanted_object):
+def _get_region_positions_for(id_at_pos):
     """
-    Get the first occurrence of an object in an iterable.
+    Get the start and stop position of each region in a region array
+    as returned by :func:`_get_region_array_for()`.
 
     Parameters
     ----------
-    iterable : iterable
-        The iterable containing the object.
-    wanted_object : object
-        The object to be found.
+    id_at_pos : ndarray, dtype=int
+        The ordered array of region ids, containing each id twice.
 
     Returns
     -------
-    index : int
-        The index of the first occurrence of the object.
+    positions : dict
+        Maps each region id to the tuple of its start and stop
+        position in the region array.
     """
-    for i, value in enumerate(iterable):
-        if value is wanted_object:
-            return i
+    start_of = {}
+    positions = {}
+    for position, region_id in enumerate(id_at_pos.tolist()):
+        if region_id in start_of:
+            positions[region_id] = (start_of[region_id], position)
+        else:
+            start_of[region_id] = position
+    return positions
 
 
-def _get_region_array_for(regions, content=[], dtype=[]):
+def _get_region_array_for(regions, region_ids):
     """
-    Get a :class:`ndarray` of region objects. Each object occurs twice,
-    representing its start and end point. The regions positions in the
-    array reflect their relative positions.
-
-    Furthermore, a list of functions can be provided enabling custom
-    outputs for each objects` start and end point.
+    Get a :class:`ndarray` of region ids. Each id occurs twice,
+    representing its region's start and end point. The positions in
+    the array reflect the relative positions of the regions.
 
     Parameters
     ----------
-    regions : set {_region, ...}
-        The regions to be considered
-    content : list [function, ...] (default: [])
-        The functions to be considered for custom outputs. For a given
-        region they must return a tuple of which the first value is
-        placed at the start position and the second value at the end
-        position of the region relative to the other regions.
-    dtype : list [str, ...] (default: [])
-        The data type of the output of the custom functions.
+    regions : _Regions
+        All regions of the base pair array.
+    region_ids : set {int, ...}
+        The ids of the regions to be considered.
 
     Returns
     -------
-    region_array : ndarray, dtype=object
-        The array of ordered region objects.
-    custom_content : list [ndarray, ...]
-        The custom output.
+    id_at_pos : ndarray, dtype=int32
+        The ordered array of region ids.
+    start_stops : ndarray, dtype=int32
+        The base position corresponding to each entry of
+        ``id_at_pos``, i.e. the start or stop of the respective
+        region.
     """
-    # region_array and index array
-    region_array = np.empty(len(regions)*2, dtype=_Region)
-    index_array = np.empty(len(regions)*2, dtype='int32')
-
-    # Content array for custom return arrays
-    content_list = [None]*len(content)
-    for i in range(len(content)):
-        content_list[i] = np.empty(len(regions)*2, dtype=dtype[i])
-
-    # Fill the arrays
-    for i, reg in enumerate(regions):
-        indices = [2*i, 2*i+1]
-        region_array[indices] = reg
-        for c in range(len(content_list)):
-            content_list[c][indices] = content[c](reg)
-        index_array[indices] = [reg.start, reg.stop]
-
-    # Order the arrays by the base indices
-    sort_mask = np.argsort(index_array)
-    region_array = region_array[sort_mask]
-
-    # if no custom array content is given only return the ordered array
-    # containing the regions
-    if content == []:
-        return region_array
-
-    # if custom content is given also return the ordered content
-    for i in range(len(content_list)):
-        content_list[i] = content_list[i][sort_mask]
-    return region_array, content_list
-
-
-def _conflict_cliques(regions):
+    ids = np.fromiter(region_ids, dtype='int32', count=len(region_ids))
+
+    # Each region is represented by its start and its stop position
+    id_at_pos = np.repeat(ids, 2)
+    start_stops = np.empty(len(ids)*2, dtype='int32')
+    start_stops[0::2] = regions.starts[ids]
+    start_stops[1::2] = regions.stops[ids]
+
+    # Order the arrays by the base positions
+    sort_mask = np.argsort(start_stops)
+    return id_at_pos[sort_mask], start_stops[sort_mask]
+
+
+def _conflict_cliques(regions, region_ids):
     """
     Separate regions into mutually conflicting regions.
 
     Parameters
     ----------
-    regions : set {_region, ...}
-        The regions to be separated.
+    regions : _Regions
+        All regions of the base pair array.
+    region_ids : set {int, ...}
+        The ids of the regions to be separated.
 
     Returns
     -------
-    regions : list [set {_region, ...}, ...]
-        The separated mutually conflicting regions.
+    cliques : list [set {int, ...}, ...]
+        The ids of the separated mutually conflicting regions.
     """
-    # Get a region array and an array where each region start is denoted
-    # as ``True`` and each stop is denoted as ``False``
-    region_array, (start_stops,) = _get_region_array_for(
-        regions, content=[lambda a : [True, False]], dtype=['bool']
-    )
-    starts = np.nonzero(start_stops)[0]
+    # Get the ordered region array and the array of the corresponding
+    # base positions
+    id_at_pos, start_stops = _get_region_array_for(regions, region_ids)
+    starts = np.flatnonzero(start_stops == regions.starts[id_at_pos])
+
+    # The start and stop position of each region in the region array
+    positions = _get_region_positions_for(id_at_pos)
+
+    # The region ids as plain integers for the set operations
+    id_at_pos_list = id_at_pos.tolist()
 
     # Mutually conflicting regions
     cliques = []
@@ -431,32 +425,31 @@ def _conflict_cliques(regions):
     # Iterate region starting points from left to right
     for start_index in starts:
         # Skip if the current region has already been assigned a clique
-        if region_array[start_index] in seen:
+        if id_at_pos_list[start_index] in seen:
             continue
         # Members of the current clique that have not been assigned yet
         queue = set([start_index])
         # The current clíque
         clique = set()
-        
+
         # Execute until all regions belonging to the current region have
         # been assigned.
         while queue != set():
             # Assign new region of the queue to the current clique
             current_index = queue.pop()
-            clique.add(region_array[current_index])
-            seen.add(region_array[current_index])
+            clique.add(id_at_pos_list[current_index])
+            seen.add(id_at_pos_list[current_index])
 
             # Get regions conflicting with current region
             mutually_conflicting = _conflicting_regions(
-                region_array, current_index
+                id_at_pos, current_index, positions
             )
             # Add conflicting regions to queue, if they are not part of
             # the clique yet
             for region_index in mutually_conflicting:
-                if region_array[region_index] not in clique:
-                    queue.add(_get_first_occurrence_for(
-                        region_array, region_array[region_index])
-                    )
+                region_id = id_at_pos_list[region_index]
+                if region_id not in clique:
+                    queue.add(positions[region_id][0])
         # Once all regions conflicting with the current region have
         # been found, add clique to list of cliques
         cliques.append(clique)
@@ -464,40 +457,107 @@ def _conflict_cliques(regions):
     # Return the conflict cliques as list of sets
     return cliques
 
-def _conflicting_regions(region_array, start_index):
+def _conflicting_regions(id_at_pos, start_index, positions):
     """
-    Get regions conflicting with a specific region in a ``region_array``
-    as returned by :func:`get_region_array_for()`.
+    Get regions conflicting with a specific region in a region array
+    as returned by :func:`_get_region_array_for()`.
 
     Parameters
     ----------
-    region_array : ndarray, dtype=object
-        The array of ordered region objects.
+    id_at_pos : ndarray, dtype=int
+        The ordered array of region ids.
     start_index : int
         The start index of the region to find conflicts with
+    positions : dict
+        The region positions as returned by
+        :func:`_get_region_positions_for()`.
 
     Returns
     -------
     conflicting_regions : ndarray, dtype=int
-        Start indices of the conflicting regions 
+        Start indices of the conflicting regions
     """
-    # Get the current regions start and stop indices in the region array
-    stop_index = _get_first_occurrence_for(
-        region_array[start_index+1:], region_array[start_index]
-    )
-    stop_index = start_index + 1 + stop_index
-    # Count the occurrence of each individual region between the start 
+    # Get the current regions stop index in the region array
+    _, stop_index = positions[int(id_at_pos[start_index])]
+    # Count the occurrence of each individual region between the start
     # and stop indices of the regions
     _, index, counts = np.unique(
-        region_array[start_index+1:stop_index], 
+        id_at_pos[start_index+1:stop_index],
         return_counts=True, return_index=True
     )
-    
-    # Conflicting regions only have either their starting or stoping 
+
+    # Conflicting regions only have either their starting or stoping
     # point within the starting and stoping points of the given region.
     return index[counts==1] + start_index + 1
 
-def _remove_pseudoknots(regions):
+def _solve_cliques(regions, cliques, solution_cache):
+    """
+    Get the optimal solutions for each conflict clique.
+
+    The cliques are independent of each other. If several cliques are
+    large enough for the dynamic programming cost to dominate, they
+    are solved in parallel worker processes.
+
+    Parameters
+    ----------
+    regions : _Regions
+        All regions of the base pair array.
+    cliques : list [set {int, ...}, ...]
+        The ids of the mutually conflicting regions.
+    solution_cache : dict
+        Maps previously evaluated cliques to their optimal solutions
+        (see :func:`_remove_pseudoknots()`).
+
+    Returns
+    -------
+    solutions : list [ndarray, ...]
+        The optimal solutions for each clique.
+    """
+    uncached = [
+        clique for clique in cliques
+        if frozenset(clique) not in solution_cache
+    ]
+
+    large_clique_count = sum(
+        1 for clique in uncached
+        if len(clique) >= _MIN_PARALLEL_CLIQUE_SIZE
+    )
+    if large_clique_count >= 2 and _PICKLABLE:
+        # Multiple expensive cliques can be solved in parallel
+        with ProcessPoolExecutor() as executor:
+            clique_solutions = list(executor.map(
+                _solve_clique_worker,
+                ((regions, clique) for clique in uncached)
+            ))
+        for clique, solutions in zip(uncached, clique_solutions):
+            solution_cache[frozenset(clique)] = solutions
+    else:
+        for clique in uncached:
+            _remove_pseudoknots(regions, clique, solution_cache)
+
+    return [solution_cache[frozenset(clique)] for clique in cliques]
+
+
+def _solve_clique_worker(args):
+    """
+    Worker for the parallel path of :func:`_solve_cliques()`.
+    """
+    regions, clique = args
+    return _remove_pseudoknots(regions, clique, {})
+
+
+# This module rebinds ``__name__`` to the package name for the public
+# API, which would make pickle look up the worker function and the
+# ``_Regions`` class in ``biotite.structure``, where they are not
+# exported. Rebinding their ``__module__`` to the true import path
+# keeps them resolvable in worker processes.
+_PICKLABLE = __spec__ is not None
+if _PICKLABLE:
+    _Regions.__module__ = __spec__.name
+    _solve_clique_worker.__module__ = __spec__.name
+
+
+def _remove_pseudoknots(regions, cluster, solution_cache):
     """
     Get the optimal solutions according to the algorithm referenced in
     :func:`pseudoknots()`.
@@ -507,131 +567,300 @@ def _remove_pseudoknots(regions):
 
     Parameters
     ----------
-    regions : set {_region, ...}
-        The conflicting regions for whích optimal solutions are to be
-        found.
-    scores : ndarray
-        The score array.
+    regions : _Regions
+        All regions of the base pair array.
+    cluster : set {int, ...}
+        The ids of the conflicting regions for whích optimal solutions
+        are to be found.
+    solution_cache : dict
+        Maps previously evaluated clusters, as ``frozenset`` of region
+        ids, to their optimal solutions.
 
     Returns
     -------
     solutions : ndarray, dtype=object
         The optimal solutions. Each solution in the ``ndarray`` is
-        represented as ``set`` of unknotted regions.
+        represented as ``frozenset`` of the ids of the unknotted
+        regions.
     """
-    # Create dynamic programming matrix
-    dp_matrix_shape = len(regions)*2, len(regions)*2
-    dp_matrix = np.empty(dp_matrix_shape, dtype='object')
-    dp_matrix_solutions_starts = np.zeros_like(dp_matrix)
-    dp_matrix_solutions_stops = np.zeros_like(dp_matrix)
+    # The same cluster may reappear in a different recursion branch of
+    # `_get_results()`, in which case the dynamic programming matrix
+    # does not need to be filled again
+    cache_key = frozenset(cluster)
+    cached_solutions = solution_cache.get(cache_key)
+    if cached_solutions is not None:
+        return cached_solutions
+
+    # Each region in the cluster is assigned a local integer id
+    # corresponding to its position in the sorted cluster ids. A
+    # solution is represented as an integer bitmask over these local
+    # ids. Thus, the union of two solutions is a single bitwise ``OR``
+    # and deduplication hashes plain integers.
+    cluster_ids = np.fromiter(
+        sorted(cluster), dtype='int32', count=len(cluster)
+    )
+
+    # The start, stop and score of each region, indexed by local id
+    region_starts = regions.starts[cluster_ids]
+    region_stops = regions.stops[cluster_ids]
+    region_scores = regions.scores[cluster_ids]
+
+    # If the cluster consists of a single region or of regions that
+    # follow each other without overlap, all regions can be kept and
+    # the dynamic programming matrix does not need to be filled
+    start_order = np.argsort(region_starts)
+    if len(cluster_ids) <= 1 or np.all(
+        region_stops[start_order][:-1] < region_starts[start_order][1:]
+    ):
+        optimal_solutions = np.empty(1, dtype='object')
+        optimal_solutions[0] = frozenset(cluster_ids.tolist())
+        solution_cache[cache_key] = optimal_solutions
+        return optimal_solutions
 
     # Each index corresponds to the position in the dp matrix.
-    # ``region_array`` contains the region objects and ``start_stops``
+    # ``id_at_pos`` contains the local region ids and ``start_stops``
     # contains the lowest and highest positions of the regions
-    region_array, (start_stops,) = _get_region_array_for(
-        regions,
-        [lambda a : (a.start, a.stop)],
-        ['int32']
+    global_id_at_pos, start_stops = _get_region_array_for(regions, cluster)
+    id_at_pos = np.searchsorted(cluster_ids, global_id_at_pos).astype('int32')
+
+    # Run the dynamic programming recurrence on the primitive arrays
+    optimal_masks = _fill_dp_matrix(
+        id_at_pos, start_stops, region_starts, region_stops, region_scores
     )
-    # Initialise the matrix diagonal with ndarrays of empty frozensets
-    for i in range(len(dp_matrix)):
-        dp_matrix[i, i] = np.array([frozenset()])
+
+    # Convert the bitmasks back to sets of global region ids
+    optimal_solutions = np.empty(len(optimal_masks), dtype='object')
+    for s, mask in enumerate(optimal_masks.tolist()):
+        optimal_solutions[s] = frozenset(
+            int(cluster_ids[local_id]) for local_id in _mask_ids(mask)
+        )
+
+    solution_cache[cache_key] = optimal_solutions
+    return optimal_solutions
+
+
+def _fill_dp_matrix(id_at_pos, start_stops, region_starts, region_stops,
+                    region_scores):
+    """
+    Fill the dynamic programming matrix for :func:`_remove_pseudoknots`
+    and return the optimal solution bitmasks.
+
+    The recurrence operates exclusively on primitive :class:`ndarray`
+    inputs and integer bitmasks, keeping the hot loops free of region
+    objects.
+
+    Parameters
+    ----------
+    id_at_pos : ndarray, dtype=int, shape=(2n,)
+        The region id for each position in the ordered region array.
+        Each id appears twice, at the position of the region's start
+        and stop.
+    start_stops : ndarray, dtype=int, shape=(2n,)
+        The base position for each position in the ordered region
+        array.
+    region_starts, region_stops : ndarray, dtype=int, shape=(n,)
+        The minimum and maximum base position of each region, indexed
+        by region id.
+    region_scores : ndarray, dtype=float, shape=(n,)
+        The score of each region, indexed by region id.
+
+    Returns
+    -------
+    optimal_masks : ndarray
+        The optimal solutions as integer bitmasks over the region ids.
+    """
+    # The dynamic programming matrix, keyed by the cell position
+    # (i, j). Only the upper triangle is ever populated, so a dict
+    # avoids allocating object arrays of quadratic size.
+    position_count = len(id_at_pos)
+    dp_matrix = {}
+    dp_matrix_solutions_starts = {}
+    dp_matrix_solutions_stops = {}
+    # Whether a cell contains any non-empty solution, avoiding a sweep
+    # over the cell's candidates for every check
+    dp_matrix_nontrivial = {}
+
+    # Bitmasks of cliques with at most 64 regions fit into ``uint64``,
+    # larger cliques fall back to arbitrary-width Python integers in an
+    # object array, for which the same array expressions apply
+    region_count = len(region_starts)
+    mask_dtype = np.uint64 if region_count <= 64 else 'object'
+
+    # O(1) lookup from a base position to its position in the region
+    # array, replacing repeated linear searches through `start_stops`
+    pos_of_base = np.full(int(start_stops.max()) + 1, -1, dtype=np.intp)
+    pos_of_base[start_stops] = np.arange(position_count)
+
+    # Scratch matrix for the extent computation, reused across cells
+    # and grown on demand to avoid an allocation per cell
+    scratch = np.empty((1, region_count), dtype='int32')
+
+    # Initialise the matrix diagonal with the empty solution
+    for i in range(position_count):
+        dp_matrix[i, i] = np.array([0], dtype=mask_dtype)
+        dp_matrix_nontrivial[i, i] = False
 
     # Iterate through the top right half of the dynamic programming
     # matrix
-    for j in range(len(regions)*2):
+    for j in range(position_count):
         for i in range(j-1, -1, -1):
-            solution_candidates = set()
             left = dp_matrix[i, j-1]
             bottom = dp_matrix[i+1, j]
 
-            # Add all solutions of the cell to the left
-            for solution in left:
-                solution_candidates.add(solution)
-
-            # Add all solutions of the cell to the bottom
-            for solution in bottom:
-               solution_candidates.add(solution)
+            # Add all solutions of the cells to the left and to the
+            # bottom
+            candidate_buffers = [left, bottom]
 
             # Check if i and j are start/end-points of the same region
-            if region_array[i] is region_array[j]:
+            if id_at_pos[i] == id_at_pos[j]:
+                region_bit = 1 << int(id_at_pos[i])
 
                 # Add all solutions from the cell to the bottom left
                 # plus this region
                 bottom_left = dp_matrix[i+1, j-1]
-                for solution in bottom_left:
-                    solution_candidates.add(solution | set([region_array[i]]))
+                candidate_buffers.append(bottom_left | region_bit)
 
             # Perform additional tests if solution in the left cell and
             # bottom cell both differ from an empty solution
-            if (np.any(left != [frozenset()]) and
-                np.any(bottom != [frozenset()])):
+            if dp_matrix_nontrivial[i, j-1] and dp_matrix_nontrivial[i+1, j]:
 
                 left_highest = dp_matrix_solutions_stops[i, j-1]
                 bottom_lowest = dp_matrix_solutions_starts[i+1, j]
 
-                # For each pair of solutions check if solutions are
-                # disjoint
-                for solution1, highest in zip(left, left_highest):
-                    for solution2, lowest in zip(bottom, bottom_lowest):
-                        if highest < lowest:
-                            # Both solutions are disjoint
-                            solution_candidates.add(solution1 | solution2)
-                        else:
-                            # Both solutions are not disjoint
-                            # Add subsolutions
-                            for k in range(
-                                np.where(start_stops==lowest)[0][0]-1,
-                                np.where(start_stops==highest)[0][0]+1
-                            ):
-                                cell1 = dp_matrix[i, k]
-                                cell2 = dp_matrix[k+1, j]
-                                for subsolution1 in cell1:
-                                    for subsolution2 in cell2:
-                                        solution_candidates.add(
-                                            subsolution1 | subsolution2
-                                        )
-
-            # Make solution candidates ``ndarray`` array of sets
-            solution_candidates = np.array(list(solution_candidates))
-
-            # Calculate the scores for each solution
-            solution_scores = np.zeros(len(solution_candidates))
-            for s, solution in enumerate(solution_candidates):
-                score = 0
-                for reg in solution:
-                    score += reg.score
-                solution_scores[s] = score
+                # Pairs of solutions that are disjoint can be combined
+                # directly
+                disjoint = left_highest[:, np.newaxis] < bottom_lowest
+                candidate_buffers.append(
+                    (left[:, np.newaxis] | bottom)[disjoint]
+                )
+
+                # For each pair of solutions that is not disjoint, add
+                # the subsolutions instead
+                # The visited split points are collected first, as the
+                # ranges of different pairs overlap
+                split_points = set()
+                for l, b in zip(*np.nonzero(~disjoint)):
+                    highest = left_highest[l]
+                    lowest = bottom_lowest[b]
+                    split_points.update(range(
+                        pos_of_base[lowest] - 1,
+                        pos_of_base[highest] + 1
+                    ))
+                for k in split_points:
+                    cell1 = dp_matrix[i, k]
+                    cell2 = dp_matrix[k+1, j]
+                    candidate_buffers.append(
+                        (cell1[:, np.newaxis] | cell2).ravel()
+                    )
+
+            # Deduplicate the candidates
+            # np.unique also imposes a deterministic order
+            solution_candidates = np.unique(
+                np.concatenate(candidate_buffers)
+            )
+
+            # The contained region ids as boolean matrix with one row
+            # per candidate solution
+            solution_bits = _unpack_masks(
+                solution_candidates, region_count
+            )
+
+            # Calculate the score for each solution as matrix-vector
+            # product over the contained regions
+            solution_scores = solution_bits @ region_scores
+
+            # Calculate the minimum and maximum base position for each
+            # solution, with -1 for the empty solution
+            candidate_count = len(solution_candidates)
+            if len(scratch) < candidate_count:
+                scratch = np.empty(
+                    (max(candidate_count, 2 * len(scratch)), region_count),
+                    dtype='int32'
+                )
+            extents = scratch[:candidate_count]
+            excluded = ~solution_bits
+            np.copyto(extents, region_starts)
+            np.copyto(extents, np.iinfo('int32').max, where=excluded)
+            solution_starts = extents.min(axis=1)
+            np.copyto(extents, region_stops)
+            np.copyto(extents, -1, where=excluded)
+            solution_stops = extents.max(axis=1)
+            solution_starts[~solution_bits.any(axis=1)] = -1
             # Get the indices where the score is at a maximum
             highest_scores = np.argwhere(
                 solution_scores == np.amax(solution_scores)
             ).flatten()
 
-            # Get the solutions with the highest score
-            solution_candidates = solution_candidates[highest_scores]
+            # Add the solutions with the highest score to the dynamic
+            # programming matrix
+            dp_matrix[i, j] = solution_candidates[highest_scores]
+            dp_matrix_solutions_starts[i, j] = solution_starts[highest_scores]
+            dp_matrix_solutions_stops[i, j] = solution_stops[highest_scores]
+            # The candidates are sorted, so the cell contains a
+            # non-empty solution exactly if the last mask is non-zero
+            dp_matrix_nontrivial[i, j] = bool(dp_matrix[i, j][-1])
 
-            # Add the solutions to the dynamic programming matrix
-            dp_matrix[i, j] = solution_candidates
+    # The top right corner contains the optimal solutions
+    return dp_matrix[0, position_count - 1]
 
-            solution_starts = np.zeros_like(solution_candidates, dtype='int32')
-            solution_stops = np.zeros_like(solution_candidates, dtype='int32')
 
-            for s, solution in enumerate(solution_candidates):
-                solution_starts[s] = min(
-                    [reg.start for reg in solution], default=-1
-                )
-                solution_stops[s] = max(
-                    [reg.stop for reg in solution], default=-1
-                )
+def _unpack_masks(masks, region_count):
+    """
+    Unpack solution bitmasks into a boolean matrix.
 
-            dp_matrix_solutions_starts[i, j] = solution_starts
-            dp_matrix_solutions_stops[i, j] = solution_stops
+    Parameters
+    ----------
+    masks : ndarray or list [int, ...]
+        The solution bitmasks.
+    region_count : int
+        The number of regions the bitmasks cover.
 
-    # The top right corner contains the optimal solutions
-    return dp_matrix[0, -1]
+    Returns
+    -------
+    bits : ndarray, dtype=bool, shape=(len(masks), region_count)
+        For each solution, ``True`` at the ids of the contained
+        regions.
+    """
+    word_count = (region_count + 63) // 64
+    if word_count == 1:
+        words = np.asarray(masks, dtype=np.uint64).reshape(-1, 1)
+    else:
+        words = np.array(
+            [
+                [(int(mask) >> (64 * word)) & 0xFFFFFFFFFFFFFFFF
+                 for word in range(word_count)]
+                for mask in masks
+            ],
+            dtype=np.uint64
+        )
+    bits = np.unpackbits(
+        words.astype('<u8', copy=False).view(np.uint8), bitorder='little'
+    )
+    return bits.reshape(len(masks), -1)[:, :region_count].astype(bool)
 
 
-def _get_results(regions, results, max_pseudoknot_order, order=0):
+def _mask_ids(mask):
+    """
+    Yield the region ids whose bits are set in a solution bitmask.
+
+    Parameters
+    ----------
+    mask : int
+        The solution bitmask.
+
+    Yields
+    ------
+    region_id : int
+        The id of each region contained in the solution.
+    """
+    while mask:
+        lowest_bit = mask & -mask
+        yield lowest_bit.bit_length() - 1
+        mask ^= lowest_bit
+
+
+def _get_results(regions, region_ids, results, max_pseudoknot_order, order=0,
+                 solution_cache=None):
     """
     Use the dynamic programming algorithm to get the pseudoknot order
     of a given set of regions. If there are remaining conflicts their
@@ -640,8 +869,11 @@ def _get_results(regions, results, max_pseudoknot_order, order=0):
 
     Parameters
     ----------
-    regions : set {_region, ...}
-        The regions for whích optimal solutions are to be found.
+    regions : _Regions
+        All regions of the base pair array.
+    region_ids : set {int, ...}
+        The ids of the regions for whích optimal solutions are to be
+        found.
     results : list [ndarray, ...]
         The results
     max_pseudoknot_order : int
@@ -650,59 +882,60 @@ def _get_results(regions, results, max_pseudoknot_order, order=0):
         is given, all base pairs are evaluated.
     order : int (default: 0)
         The order that is currently evaluated.
+    solution_cache : dict, optional
+        Maps previously evaluated clusters to their optimal solutions
+        (see :func:`_remove_pseudoknots()`).
 
     Returns
     -------
     results : list [ndarray, ...]
         The results
     """
+    if solution_cache is None:
+        solution_cache = {}
 
     # Remove non-conflicting regions
-    non_conflicting = _find_non_conflicting_regions(regions)
-    regions = regions - non_conflicting
+    non_conflicting = _find_non_conflicting_regions(regions, region_ids)
+    region_ids = region_ids - non_conflicting
 
     # Non-conflicting regions are of the current order:
-    index_list_non_conflicting = list(
-            chain(
-                *[region.get_index_array() for region in non_conflicting]
-            )
-        )
+    indices_non_conflicting = regions.get_index_array_for(non_conflicting)
     for result in results:
-        result[index_list_non_conflicting] = order
+        result[indices_non_conflicting] = order
 
 
     # If no conflicts remain, the results are complete
-    if len(regions) == 0:
+    if len(region_ids) == 0:
         return results
 
     # Get the optimal solutions for given regions. Evaluate each clique
     # of mutually conflicting regions seperately
-    cliques = _conflict_cliques(regions)
+    cliques = _conflict_cliques(regions, region_ids)
     solutions = [set(chain(*e)) for e in product(
-        *[_remove_pseudoknots(clique) for clique in cliques]
+        *_solve_cliques(regions, cliques, solution_cache)
     )]
 
     # Get a copy of the current results for each optimal solution
+    # The original arrays are not needed anymore and are reused for the
+    # last solution
     results_list = [
-        [result.copy() for result in results] for _ in range(len(solutions))
+        [result.copy() for result in results]
+        for _ in range(len(solutions) - 1)
     ]
+    results_list.append(results)
 
     # Evaluate each optimal solution
     for i, solution in enumerate(solutions):
 
         # Get the pseudoknotted regions
-        pseudoknotted_regions = regions - solution
+        pseudoknotted_regions = region_ids - solution
 
-        # Get an index list of the unknotted base pairs
-        index_list_unknotted = list(
-            chain(
-                *[region.get_index_array() for region in solution]
-            )
-        )
+        # Get an index array of the unknotted base pairs
+        indices_unknotted = regions.get_index_array_for(solution)
 
         # Write results for current solution
         for j, result in enumerate(results_list[i]):
-            result[index_list_unknotted] = order
+            result[indices_unknotted] = order
 
         # If this order is the specified maximum order, stop evaluation
         if max_pseudoknot_order == order:
@@ -710,8 +943,9 @@ def _get_results(regions, results, max_pseudoknot_order, order=0):
 
         # Evaluate the pseudoknotted region
         results_list[i] = _get_results(
-            pseudoknotted_regions, results_list[i],
-            max_pseudoknot_order, order=order+1
+            regions, pseudoknotted_regions, results_list[i],
+            max_pseudoknot_order, order=order+1,
+            solution_cache=solution_cache
         )
 
     # Flatten the results
@@ -8,6 +8,7 @@ import numpy as np
 import pickle as pkl
 import biotite.structure as struc
 import biotite.structure.io as strucio
+from importlib import import_module
 from os.path import join
 from ..util import data_dir
 
@@ -116,6 +117,30 @@ def test_pseudoknot_removal(name):
     # Verify that the number of solutions matches the reference
     assert len(reference_solutions) == solutions_count
 
+def test_pseudoknot_parallel_cliques(monkeypatch):
+    """
+    Force the parallel clique solving branch with a lowered size
+    threshold and assert that the solutions match the sequential path.
+    """
+    module = import_module("biotite.structure.pseudoknots")
+
+    # Two separated blocks of mutually crossing base pairs form two
+    # conflict cliques that are solved in separate worker processes
+    block = np.stack([np.arange(8), np.arange(8) + 8], axis=1)
+    basepairs = np.concatenate([block, block + 1000])
+
+    monkeypatch.setattr(module, "_MIN_PARALLEL_CLIQUE_SIZE", 2)
+    parallel_solutions = struc.pseudoknots(basepairs, max_pseudoknot_order=0)
+    monkeypatch.setattr(
+        module, "_MIN_PARALLEL_CLIQUE_SIZE", len(basepairs) + 1
+    )
+    serial_solutions = struc.pseudoknots(basepairs, max_pseudoknot_order=0)
+
+    assert (
+        set(tuple(solution) for solution in parallel_solutions)
+        == set(tuple(solution) for solution in serial_solutions)
+    )
+
 @pytest.mark.parametrize("seed", range(10))
 def test_pseudoknot_orders(seed):
     """